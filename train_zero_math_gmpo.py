@@ -13,11 +13,10 @@
 # limitations under the License.
 
 import functools
-import itertools
 import logging
 import time
 from dataclasses import dataclass, field
-from multiprocessing import Pool, TimeoutError
+from multiprocessing import Pool, TimeoutError as PoolTimeoutError
 from typing import Any, List, Literal, Tuple
 
 import numpy as np
@@ -36,10 +35,9 @@ from torch.utils.data import DataLoader
 
 from datasets import load_from_disk
 from understand_r1_zero_main.understand_r1_zero.math_grader import (answer_tag_reward_fn,
-                                            boxed_reward_fn)
+                                            boxed_reward_fn, timeout)
 
 import os
-import gc
 import json
 import vllm
 import copy
@@ -98,6 +96,35 @@ TEMPLATE_FACTORY = {
 We instantiate the oracle based on Oat's OracleBase and implement the grading logic.
 """
 
+# Grading function installed in each worker of the oracle's process pool.
+_worker_reward_fn = None
+
+
+def _init_grading_worker(math_reward_fn):
+    global _worker_reward_fn
+    _worker_reward_fn = math_reward_fn
+
+
+# Per-response grading time limit, in seconds.
+_GRADING_TIMEOUT = 1
+
+
+def _grade_chunk(items):
+    """Grades (index, response, reference) items inside a pool worker, keeping their indices.
+
+    The worker's own alarm is only best-effort: the verifier nests its own `timeout` blocks (whose
+    exit cancels this one), swallows exceptions, and can be stuck in C code that SIGALRM cannot
+    interrupt. The caller therefore also enforces a deadline (see `MATHOracle.collect_reward`).
+    """
+    results = []
+    for i, resp, ref in items:
+        try:
+            with timeout(_GRADING_TIMEOUT):
+                results.append((i, _worker_reward_fn(resp, ref)))
+        except TimeoutError:
+            results.append((i, ({"formatted": False, "timeout": True}, 0.0)))
+    return results
+
 
 class MATHOracle(RewardOracleBase, PreferenceOracleBase):
     """Defines the verification rules for the math answer grading."""
@@ -111,8 +138,21 @@ class MATHOracle(RewardOracleBase, PreferenceOracleBase):
         self.math_reward_fn = functools.partial(
             math_reward_fn, fast=verifier_version == "fast"
         )
-        # Process pool is used to enable the timeout mechanism for answer grading in our distributed training setup.
-        self.mp_pool = Pool(2)
+        # Process pool is used to grade the whole batch in parallel; the timeout mechanism
+        # for answer grading is enforced both inside the workers and by the caller.
+        self.num_workers = min(16, os.cpu_count() or 1)
+        self.mp_pool = self._make_pool()
+
+    def _make_pool(self):
+        return Pool(
+            self.num_workers,
+            initializer=_init_grading_worker,
+            initargs=(self.math_reward_fn,),
+        )
+
+    def _restart_pool(self):
+        self.mp_pool.terminate()
+        self.mp_pool = self._make_pool()
 
     def get_reward(
         self,
@@ -124,19 +164,62 @@ class MATHOracle(RewardOracleBase, PreferenceOracleBase):
         # Parameters used by Oat when using model-based reward, here we don't need.
         del inputs, batch_size
 
-        rewards = []
-        infos = []
-        for resp, ref in zip(responses, references):
-            res = self.mp_pool.apply_async(self.math_reward_fn, (resp, ref))
-            try:
-                info, r = res.get(timeout=1)
-                rewards.append(r)
-                infos.append(info)
-            except TimeoutError:
-                rewards.append(0.0)
-                infos.append({"formatted": False})
-
-        return torch.tensor(rewards), infos
+        results = self.submit_reward(responses, references)
+        return self.collect_reward(results, len(responses))
+
+    def submit_reward(self, responses: List[str], references: List[str]):
+        """Starts grading in the background; pass the returned handle to `collect_reward`."""
+        # Submit the whole batch at once to amortize IPC and pickling over chunks. The chunks are
+        # built here rather than via `chunksize`, which would make imap return a plain generator
+        # without `next(timeout=...)`.
+        items = list(zip(range(len(responses)), responses, references))
+        # Capped, since a chunk with a stuck item is only detected after a chunk's time limit.
+        chunksize = min(8, max(1, len(items) // (2 * self.num_workers)))
+        chunks = [items[k : k + chunksize] for k in range(0, len(items), chunksize)]
+        return self.mp_pool.imap_unordered(_grade_chunk, chunks), items, chunksize
+
+    def _drain(self, results, chunksize, rewards, infos):
+        """Collects results until the pool goes quiet for longer than a chunk can take.
+
+        Returns the indices that are still ungraded, i.e. [] unless a worker is stuck.
+        """
+        try:
+            while True:
+                chunk = results.next(timeout=chunksize * _GRADING_TIMEOUT + 1)
+                for i, (info, r) in chunk:
+                    rewards[i] = r
+                    infos[i] = info
+        except StopIteration:
+            return []
+        except PoolTimeoutError:
+            return [i for i, info in enumerate(infos) if info is None]
+
+    def collect_reward(self, handle, num_responses: int) -> Tuple[torch.Tensor, Metric]:
+        """Waits for the results of `submit_reward`, bounding the time spent on stuck items."""
+        results, items, chunksize = handle
+        rewards = np.zeros(num_responses, dtype=np.float32)
+        infos = [None] * num_responses
+        missing = self._drain(results, chunksize, rewards, infos)
+        while missing:
+            # A worker is stuck past its own alarm and keeps its slot (and the rest of its chunk):
+            # replace the pool and regrade the ungraded items one at a time.
+            self._restart_pool()
+            results = self.mp_pool.imap_unordered(
+                _grade_chunk, [[items[i]] for i in missing]
+            )
+            missing = self._drain(results, 1, rewards, infos)
+            # The pool only goes quiet once every busy worker is stuck; tasks are dispatched in
+            # order, so the stuck items are the first `num_workers` ungraded ones. Give up on those.
+            for i in missing[: self.num_workers]:
+                infos[i] = {"formatted": False, "timeout": True}
+            missing = missing[self.num_workers :]
+            if not missing:
+                self._restart_pool()
+        num_timeouts = sum(info.get("timeout", False) for info in infos)
+        if num_timeouts:
+            logging.warning(f"grading timed out for {num_timeouts}/{num_responses} responses")
+
+        return torch.from_numpy(rewards), infos
 
     def compare(
         self,
@@ -149,6 +232,8 @@ class MATHOracle(RewardOracleBase, PreferenceOracleBase):
     ) -> Tuple[List[Any], Metric]:
         """Facilitates easier evaluation, returning accuracy as winning probability."""
         del batch_size, return_probs, disable_tqdm
+        # During evaluation Oat passes the ground-truth answers as `candidates_B`, so each
+        # response is graded exactly once, through the same batched pool as training rewards.
         rewards, info = self.get_reward(inputs, candidates_A, candidates_B)
         return rewards.numpy(), info
 
@@ -170,6 +255,10 @@ class ZeroMathArgs(PPOArgs):
     critic_type_modify_advantage: str = ""
     do_record_learning_step: str = ""
     step_method_modify: str = ""
+    # Pad every rollout to prompt_max_length + generate_max_length so that all policy updates see
+    # one shape, and compile the policy loss with mode="reduce-overhead" (CUDA graphs). Trades the
+    # per-mini-batch padding trimming (longer forwards) for fewer kernel launches.
+    loss_cuda_graphs: bool = False
 
 
 """
@@ -186,6 +275,10 @@ class ZeroMathActor(PPOActor):
             verifier_version=self.args.verifier_version,
         )
 
+        # Only the sampled token's logprob is needed, so each per-token logprob dict
+        # returned by vLLM holds a single entry.
+        self.sampling_params.logprobs = 0
+
         if self.args.prompt_template in ["qwen_math", "no"]:
             # These two templates are better used for Qwen models, which can themselves stop generation. Hence we unset all external stopping conditions.
             self.sampling_params.stop = None
@@ -211,91 +304,222 @@ class ZeroMathActor(PPOActor):
         logging.info(f"actor start")
 
         # step 1. generate
+        # All prompts go to vLLM in a single `generate` call so its continuous batching can
+        # schedule across the whole rollout batch; group sampling uses `sampling_params.n`
+        # rather than repeating prompts on the Python side.
         st = time.time()
         outputs = self.generate(formatted_prompts, self.sampling_params)
 
-        candidates = []
-        prompt_token_ids = []
-        no_eos = []
-        response_ids = []
-        response_logprobs = []
-        resp_lens = []
-        for i in range(len(outputs)):
-            # for each prompt
-            prompt_token_ids.append(outputs[i].prompt_token_ids)
-            candidates.append([])
-            response_logprobs.append([])
-            response_ids.append([])
-            for k in range(self.sampling_params.n):
-                # for each response
-                candidates[i].append(outputs[i].outputs[k].text)
-                no_eos.append(outputs[i].outputs[k].finish_reason == "length")
-                token_ids = outputs[i].outputs[k].token_ids
-                logps = outputs[i].outputs[k].logprobs
-                logps = [item[token_ids[i]].logprob for i, item in enumerate(logps)]
-                response_logprobs[i].append(logps)
-                response_ids[i].append(token_ids)
-                resp_lens.append(len(token_ids))
+        # Indexed as [prompt][response].
+        candidates = [[o.text for o in out.outputs] for out in outputs]
 
-        info["actor/generate_time"] = time.time() - st
+        # step 2. verify, in the oracle's process pool while the rollouts are post-processed.
+        verify_st = time.time()
+        n = self.sampling_params.n
+        pending_rewards = self.oracle.submit_reward(
+            tree.flatten(candidates), [r for r in references for _ in range(n)]
+        )
 
-        # step 2. verify
-        st = time.time()
-        rewards, oracle_infos = self.oracle.get_reward(
-            list(
-                itertools.chain.from_iterable(
-                    itertools.repeat(x, self.sampling_params.n) for x in prompts
-                )
-            ),
-            tree.flatten(candidates),
-            list(
-                itertools.chain.from_iterable(
-                    itertools.repeat(x, self.sampling_params.n) for x in references
-                )
+        prompt_token_ids = [out.prompt_token_ids for out in outputs]
+        response_ids = [[o.token_ids for o in out.outputs] for out in outputs]
+        # Flattened over all responses.
+        resp_lens = np.fromiter(
+            (len(o.token_ids) for out in outputs for o in out.outputs), dtype=np.int64
+        )
+        # Sampled-token logprobs of all responses are packed into one flat float32 buffer;
+        # response k owns flat_logprobs[offsets[k] : offsets[k + 1]].
+        offsets = np.zeros(len(resp_lens) + 1, dtype=np.int64)
+        np.cumsum(resp_lens, out=offsets[1:])
+        flat_logprobs = np.fromiter(
+            (
+                next(iter(lp.values())).logprob
+                for out in outputs
+                for o in out.outputs
+                for lp in o.logprobs
             ),
+            dtype=np.float32,
+            count=offsets[-1],
+        )
+        no_eos = np.fromiter(
+            (o.finish_reason == "length" for out in outputs for o in out.outputs),
+            dtype=bool,
         )
 
-        info["actor/verify_time"] = time.time() - st
+        info["actor/generate_time"] = time.time() - st
+
+        # Wall-clock from submission, so it includes the overlapped post-processing above.
+        rewards, oracle_infos = self.oracle.collect_reward(pending_rewards, len(no_eos))
+        info["actor/verify_time"] = time.time() - verify_st
         logging.info(f"actor reward {rewards.mean()}")
         info["actor/rewards"] = rewards.mean().item()
         info["actor/num_data"] = rewards.numel()
         info["actor/formatted"] = np.mean([i["formatted"] for i in oracle_infos])
+        info["actor/grading_timeouts"] = sum(i.get("timeout", False) for i in oracle_infos)
         info["actor/response_tok_len"] = np.mean(resp_lens)
         info["actor/sampling_max_tokens"] = self.sampling_params.max_tokens
         info["actor/sampling_temperature"] = self.sampling_params.temperature
 
-        rewards = rewards.reshape(len(prompts), -1)
-        no_eos = np.array(no_eos).reshape(len(prompts), -1)
         info["actor/no_eos_count"] = no_eos.sum()
 
+        # Per-response fields, computed for the whole flattened batch at once.
+        # Set zero reward for truncated outputs.
+        final_rewards = np.where(no_eos, 0.0, rewards.numpy()).tolist()
+        if self.args.ignore_no_eos:
+            loss_masks = (~no_eos).tolist()
+        else:
+            loss_masks = [True] * len(no_eos)
+        resp_lens = resp_lens.tolist()
+
         trajectory_data = []
-        for i in range(len(candidates)):
-            prompt = prompts[i]
-            candidates_per_prompt = candidates[i]
-            for j in range(len(candidates_per_prompt)):
-                reward = rewards[i][j].item()
-                if no_eos[i][j]:
-                    # Set zero reward for truncated outputs.
-                    reward = 0
-                dense_rewards = [0] * len(response_ids[i][j])
-                dense_rewards[-1] = reward
-                trajectory_data.append(
-                    TrajectoryData(
-                        prompt=prompt,
-                        prompt_ids=prompt_token_ids[i],
-                        response=candidates_per_prompt[j],
-                        response_ids=response_ids[i][j],
-                        response_logprobs=response_logprobs[i][j],
-                        rewards=dense_rewards,
-                        loss_mask=not no_eos[i][j] if self.args.ignore_no_eos else True,
-                        info=info,
-                    )
+        for k in range(len(final_rewards)):
+            i, j = divmod(k, n)
+            trajectory_data.append(
+                TrajectoryData(
+                    prompt=prompts[i],
+                    prompt_ids=prompt_token_ids[i],
+                    response=candidates[i][j],
+                    response_ids=response_ids[i][j],
+                    # A view into the packed buffer; it pickles as a compact float32 array.
+                    response_logprobs=flat_logprobs[offsets[k] : offsets[k + 1]],
+                    # Dense rewards are zero everywhere but the last (eos) token.
+                    rewards=[0] * (resp_lens[k] - 1) + [final_rewards[k]],
+                    loss_mask=loss_masks[k],
+                    info=info,
                 )
+            )
         logging.info(f"actor finished data_len={len(trajectory_data)}")
         handle = self.ipc_client.serialize_ipc(trajectory_data)
         return handle
 
 
+# Policy-loss functions, one per `critic_type_modify`. Each is a pure function of the mini-batch
+# tensors; the learner compiles the selected one with torch.compile, so its chain of elementwise
+# ops fuses into a few kernels.
+# They take the mini-batch response-token count precomputed by the caller, and
+# return `(pg_losses, logprobs_diff, clipped)`: the per-sequence (GMPO family) or per-token
+# (PPO family) losses, the log-ratio used for logging, and the mask of clipped entries.
+# The GMPO family sums over the whole mini-batch, so it requires one sequence per mini-batch
+# (`train_batch_size_per_device == 1`, checked by the learner).
+# Masked sums use `torch.where` rather than boolean indexing, whose output shape is data-dependent.
+
+
+def _sgn_clip(logprobs_diff, mb_advantage, cliprange):
+    """Clips the log-ratio on the side selected by the advantage sign, without branching.
+
+    The sign is a tensor (A >= 0 maps to -1, A < 0 to +1) computed on device, so there is no
+    host read of the advantage and a single graph serves both signs. Returns the clipped
+    log-ratio and the mask of clipped entries.
+    """
+    sgn_advantage = torch.where(mb_advantage >= 0, -1.0, 1.0)
+    sgn_logprobs_diff = sgn_advantage * logprobs_diff
+    sgn_logprobs_diff_clamp = torch.clamp(sgn_logprobs_diff, -cliprange, cliprange)
+    sgn_logprobs_diff_max = torch.max(sgn_logprobs_diff, sgn_logprobs_diff_clamp)
+    return (
+        sgn_advantage * sgn_logprobs_diff_max,
+        sgn_logprobs_diff != sgn_logprobs_diff_clamp,
+    )
+
+
+def _gmpo_loss(
+    new_logps, mb_logps, mb_response_masks, mb_mask_count, mb_advantage, cliprange
+):
+    """GMPO: -A * geometric mean of the (sign-aware) clipped token ratios."""
+    logprobs_diff = new_logps - mb_logps
+    logprobs_diff_max, clipped = _sgn_clip(logprobs_diff, mb_advantage, cliprange)
+
+    ratio = torch.exp(
+        torch.where(mb_response_masks, logprobs_diff_max, 0.0).sum() / mb_mask_count
+    )
+    pg_losses = -mb_advantage * ratio
+    return pg_losses, logprobs_diff, clipped
+
+
+def _gmpo_seqclip_loss(
+    new_logps, mb_logps, mb_response_masks, mb_mask_count, mb_advantage, cliprange
+):
+    """GMPO with the clipping applied to the sequence-level log-ratio."""
+    logprobs_diff = torch.where(mb_response_masks, new_logps - mb_logps, 0.0).sum()
+    logprobs_diff_max, clipped = _sgn_clip(logprobs_diff, mb_advantage, cliprange)
+
+    ratio = torch.exp(logprobs_diff_max / mb_mask_count)
+    pg_losses = -mb_advantage * ratio
+    return pg_losses, logprobs_diff, clipped
+
+
+def _gmpo_without_norm_loss(
+    new_logps, mb_logps, mb_response_masks, mb_mask_count, mb_advantage, cliprange
+):
+    """GMPO without the 1/|o| normalization: -A * product of the clipped token ratios."""
+    del mb_mask_count
+    logprobs_diff = new_logps - mb_logps
+    logprobs_diff_max, clipped = _sgn_clip(logprobs_diff, mb_advantage, cliprange)
+
+    ratio = torch.exp(torch.where(mb_response_masks, logprobs_diff_max, 0.0).sum())
+    pg_losses = -mb_advantage * ratio
+    return pg_losses, logprobs_diff, clipped
+
+
+def _ppo_clip_loss(
+    new_logps, mb_logps, mb_response_masks, mb_mask_count, mb_advantage, low, high
+):
+    """GRPO/PPO: per-token max of the unclipped and [low, high]-clipped ratio losses."""
+    del mb_response_masks, mb_mask_count
+    logprobs_diff = new_logps - mb_logps
+    ratio = torch.exp(logprobs_diff)
+    pg_losses = -mb_advantage * ratio
+    pg_losses2 = -mb_advantage * torch.clamp(ratio, low, high)
+    # One comparison selects the loss and is returned as the clipped mask for `pg_clipfrac`.
+    clip_mask = pg_losses2 > pg_losses
+    pg_loss_max = torch.where(clip_mask, pg_losses2, pg_losses)
+    return pg_loss_max, logprobs_diff, clip_mask
+
+
+@torch.compile(fullgraph=True, dynamic=True)
+def _kl3(mb_ref_logps, new_logps, mb_response_masks):
+    """Per-token k3 KL and its masked per-sequence sum averaged over the batch, in one graph."""
+    # k3 kl: http://joschu.net/blog/kl-approx.html.
+    # clamp to avoid numerical instability.
+    log_ratio = (mb_ref_logps - new_logps).clamp(-40.0, 40.0)
+    kl3 = torch.expm1(log_ratio) - log_ratio  # expm1 is more stable.
+    kl3_sum = torch.where(mb_response_masks, kl3, 0.0).sum(1).mean()
+    return kl3_sum, kl3
+
+
+@torch.compile(fullgraph=True, dynamic=True)
+def _masked_aminmax(x, mask):
+    """Min and max of `x` over `mask`; (0, 0) if the mask is empty."""
+    any_valid = mask.any()
+    lo = torch.where(mask, x, float("inf")).amin()
+    hi = torch.where(mask, x, float("-inf")).amax()
+    return torch.where(any_valid, lo, 0.0), torch.where(any_valid, hi, 0.0)
+
+
+@torch.compile(fullgraph=True, dynamic=True)
+def _vf_loss(value_pred, mb_values, mb_return, cliprange_value):
+    """Clipped value loss; the clipped-side mask is shared by the max and `vf_clipfrac`."""
+    value_pred_clipped = torch.clamp(
+        value_pred, mb_values - cliprange_value, mb_values + cliprange_value
+    )
+    vf_losses1 = torch.square(value_pred - mb_return)
+    vf_losses2 = torch.square(value_pred_clipped - mb_return)
+    vf_clipped = vf_losses2 > vf_losses1
+    return torch.where(vf_clipped, vf_losses2, vf_losses1), vf_clipped
+
+
+@torch.compile(fullgraph=True, dynamic=True)
+def _masked_mean_then_mean(x, resp_mask, loss_mask, normalizer=None):
+    """Batch mean of the `loss_mask`-weighted per-sequence masked means of `x`.
+
+    With `normalizer`, each masked sum is divided by that constant instead (Dr. GRPO).
+    """
+    num = (x * resp_mask).sum(-1)
+    den = resp_mask.sum(-1).clamp_min(1.0) if normalizer is None else normalizer
+    return ((num / den) * loss_mask).mean()
+
+
+GMPO_LOSS_TYPES = ("gmpo", "gmpo_noclip", "gmpo_seqclip", "gmpo_without_norm")
+
+
 """
 4. Instantiate the learner based on PPOLearner. Here we adapt the `evaluate` logic to run multiple math benchmarks.
 """
@@ -304,6 +528,11 @@ class ZeroMathActor(PPOActor):
 class ZeroMathLearner(PPOLearner):
     def _init(self, args: ZeroMathArgs, actors: List[ActorBase]) -> None:
         super()._init(args, actors)
+        # Variable-length rollouts and per-mini-batch trimming produce differently-shaped tensors
+        # every step; expandable segments let the caching allocator grow blocks in place instead of
+        # fragmenting. Set on the learner process only: vLLM's sleep mode (used by the collocated
+        # actors) allocates through its own memory pool, which does not support expandable segments.
+        torch.cuda.memory._set_allocator_settings("expandable_segments:True")
         self.eval_dataset_dict = load_from_disk(args.eval_data)  # TODO: get fro HF.
         if args.test_split != "all":
             self.eval_dataset_dict = {
@@ -311,11 +540,55 @@ class ZeroMathLearner(PPOLearner):
             }
         self.args = args
         # Dr. GRPO Modification 1: Remove length bias by using masked_sum with a constant normalizer:
-        self.masked_aggregator = (
-            functools.partial(masked_sum, constant_normalizer=args.generate_max_length)
-            if args.critic_type == "drgrpo"
-            else masked_mean
+        self.masked_aggregate_mean = functools.partial(
+            _masked_mean_then_mean,
+            normalizer=args.generate_max_length if args.critic_type == "drgrpo" else None,
+        )
+        # The policy loss is selected (and compiled on first use) once, not per mini-batch.
+        cliprange = args.cliprange
+        loss_fn, loss_kwargs = {
+            "gmpo": (_gmpo_loss, dict(cliprange=cliprange)),
+            "gmpo_noclip": (_gmpo_loss, dict(cliprange=1000.0)),
+            "gmpo_seqclip": (_gmpo_seqclip_loss, dict(cliprange=cliprange)),
+            "gmpo_without_norm": (_gmpo_without_norm_loss, dict(cliprange=cliprange)),
+            "grpo_clip_wider": (_ppo_clip_loss, dict(low=0.67, high=1.49)),
+        }.get(
+            args.critic_type_modify,
+            (_ppo_clip_loss, dict(low=1.0 - cliprange, high=1.0 + cliprange)),
+        )
+        compile_kwargs = (
+            dict(mode="reduce-overhead", dynamic=False)
+            if args.loss_cuda_graphs
+            else dict(dynamic=True)
+        )
+        self._compiled_loss_fn = functools.partial(
+            torch.compile(loss_fn, fullgraph=True, **compile_kwargs), **loss_kwargs
+        )
+        assert (
+            args.critic_type_modify not in GMPO_LOSS_TYPES
+            or args.train_batch_size_per_device == 1
+        ), "GMPO losses are computed over a single sequence; set train_batch_size_per_device=1."
+        # Persistent buffers for the old-policy / reference log probabilities; learning_step
+        # slices views out of them instead of allocating fresh tensors on every step.
+        max_batch_size = args.rollout_batch_size_per_device * args.num_samples
+        max_seq_len = args.prompt_max_length + args.generate_max_length
+        self._logps_buf = torch.zeros(
+            max_batch_size, max_seq_len, device=torch.cuda.current_device()
+        )
+        self._ref_logps_buf = (
+            torch.zeros_like(self._logps_buf) if self.ref_model is not None else None
+        )
+        # Flat scratch buffer the per-mini-batch reference log probabilities are gathered into.
+        self._ref_mb_buf = (
+            torch.empty(
+                args.train_batch_size_per_device * max_seq_len,
+                device=torch.cuda.current_device(),
+            )
+            if self.ref_model is not None
+            else None
         )
+        # Host-side index buffer for the per-epoch mini-batch shuffling.
+        self._perm_buf = torch.empty(max_batch_size, dtype=torch.long)
 
         if self.strategy.is_rank_0():
             # 保存 logs_dict 到 logs/{datetime}.log
@@ -504,34 +777,85 @@ class ZeroMathLearner(PPOLearner):
         )
         return all_metrics
 
+    @staticmethod
+    def _zeroed_view(buf, rows, cols):
+        """Returns a zeroed (rows, cols) view of `buf`, or a fresh tensor if it does not fit."""
+        if rows <= buf.shape[0] and cols <= buf.shape[1]:
+            return buf[:rows, :cols].zero_()
+        return torch.zeros(rows, cols, device=buf.device)
+
+    @staticmethod
+    def _gather_rows(buf, src, index):
+        """Gathers `src[index]` into the front of the flat `buf`, or a fresh tensor if it does not fit."""
+        rows, cols = index.numel(), src.shape[1]
+        if buf is None or rows * cols > buf.numel():
+            return src.index_select(0, index)
+        out = buf[: rows * cols].view(rows, cols)
+        return torch.index_select(src, 0, index, out=out)
+
+    def get_chunked_batch_logps(self, logits, labels, loss_mask, chunk_size=256):
+        """Same as `get_batch_logps`, for gradient-free forwards.
+
+        The logits stay in the model's native dtype; only `chunk_size` positions at a time are
+        upcast to fp32, temperature-scaled and normalized, which bounds the fp32 copy of the
+        (B, T, V) logits to (B, chunk_size, V).
+        """
+        labels = labels[:, 1:].masked_fill(~loss_mask, 0)
+        logits = logits[:, :-1]
+        logps = torch.empty(labels.shape, dtype=torch.float32, device=logits.device)
+        for st in range(0, labels.shape[1], chunk_size):
+            chunk_logits = logits[:, st : st + chunk_size].float() / self.args.temperature
+            logps[:, st : st + chunk_size] = torch.gather(
+                chunk_logits.log_softmax(-1),
+                dim=2,
+                index=labels[:, st : st + chunk_size].unsqueeze(2),
+            ).squeeze(2)
+        return logps * loss_mask
+
     def learning_step(self, trajectory):
         args: PPOArgs = self.args
         infos = {}
         device = torch.cuda.current_device()
         input_ids = trajectory["input_ids"].to(device)
         att_mask = trajectory["attention_mask"].to(device)
+        if args.loss_cuda_graphs:
+            # Fixed width, so the CUDA-graphed policy loss is captured once (see ZeroMathArgs).
+            pad = args.prompt_max_length + args.generate_max_length - input_ids.shape[1]
+            input_ids = torch.nn.functional.pad(
+                input_ids, (0, max(pad, 0)), value=self.tokenizer.pad_token_id
+            )
+            att_mask = torch.nn.functional.pad(att_mask, (0, max(pad, 0)))
+        # Valid (right-padded) length of every sequence, kept on host so that trimming the
+        # padding of each mini-batch needs neither a device reduction nor a sync.
+        row_lens = trajectory["attention_mask"].sum(1).numpy()
+        # Host->device copies go through pinned memory so they do not block the stream.
         final_rewards = (
-            torch.tensor([r[-1] for r in trajectory["rewards"]])
-            .to(device)
-            .reshape(-1, 1)
-        ).float() * args.reward_scale
+            torch.from_numpy(
+                np.fromiter((r[-1] for r in trajectory["rewards"]), dtype=np.float32)
+            )
+            .pin_memory()
+            .to(device, non_blocking=True)
+            .mul_(args.reward_scale)
+            .view(-1, 1)
+        )
         prompt_id_lens = trajectory["prompt_ids_lens"]
         # action_logprobs = [
         #     torch.tensor(lp).to(device) for lp in trajectory["action_logprobs"]
         # ]
-        loss_masks = torch.tensor(trajectory["loss_masks"]).float().to(device)
+        loss_masks = (
+            torch.from_numpy(np.asarray(trajectory["loss_masks"], dtype=np.float32))
+            .pin_memory()
+            .to(device, non_blocking=True)
+        )
         completion_masks = self.get_completion_mask(att_mask, prompt_id_lens)
         response_masks = completion_masks[:, 1:]
 
         logging.info(f"learn data size {input_ids.shape}")
 
-        indices = torch.arange(
-            response_masks.size(1), device=response_masks.device
-        ).expand_as(response_masks)
-        masked_indices = torch.where(
-            response_masks, indices, torch.full_like(indices, -1)
+        # Position of the last response token: the first True when scanning each row backwards.
+        eos_indices = (response_masks.size(1) - 1) - torch.argmax(
+            response_masks.flip(1).to(torch.int8), dim=1
         )
-        eos_indices = masked_indices.max(dim=1).values
 
         # Forward old models.
         ## 1) (Option 1) Policy log probabilities are directly from actors (vLLM).
@@ -539,65 +863,60 @@ class ZeroMathLearner(PPOLearner):
         # for i in range(len(logps)):
         #     logps[i, torch.where(response_masks[i])[0]] = action_logprobs[i]
         ## 2) (Option 2) Reevaluate log probabilities using learner model.
-        logps = torch.zeros(
-            input_ids.shape[0], input_ids.shape[1] - 1, device=input_ids.device
+        logps = self._zeroed_view(
+            self._logps_buf, input_ids.shape[0], input_ids.shape[1] - 1
+        )
+        ## 3) Reference log probabilities are computed in the same sweep, reusing the trimmed mini-batch.
+        ref_logps = (
+            self._zeroed_view(
+                self._ref_logps_buf, input_ids.shape[0], input_ids.shape[1] - 1
+            )
+            if self.ref_model is not None
+            else None
         )
         with torch.no_grad():
             for i in range(0, len(input_ids), args.train_batch_size_per_device):
-                mini_batch_inds = torch.arange(i, i + args.train_batch_size_per_device)
+                # A slice, so the mini-batch tensors below are views rather than gathered copies.
+                mini_batch_inds = slice(i, i + args.train_batch_size_per_device)
                 mb_input_ids = input_ids[mini_batch_inds]
                 mb_att_mask = att_mask[mini_batch_inds]
                 mb_response_masks = response_masks[mini_batch_inds]
 
                 # Remove unnecessary padding introduced by the large PPO batch.
-                mb_valid_token_count_per_pos = mb_att_mask.sum(0)
-                mb_last_valid_token_pos = torch.where(
-                    mb_valid_token_count_per_pos == 0
-                )[0]
-                if len(mb_last_valid_token_pos) >= 1:
-                    mb_last_valid_token_pos = mb_last_valid_token_pos[0]
-                else:
-                    mb_last_valid_token_pos = mb_att_mask.shape[1]
+                mb_last_valid_token_pos = int(
+                    row_lens[i : i + args.train_batch_size_per_device].max()
+                )
                 mb_input_ids = mb_input_ids[:, :mb_last_valid_token_pos]
                 mb_att_mask = mb_att_mask[:, :mb_last_valid_token_pos]
                 mb_response_masks = mb_response_masks[:, : mb_last_valid_token_pos - 1]
 
                 batch_logits = self.model(mb_input_ids, attention_mask=mb_att_mask)[
                     "logits"
-                ].float()
-                batch_logits /= args.temperature
-                batch_logps = self.get_batch_logps(
+                ]
+                batch_logps = self.get_chunked_batch_logps(
                     batch_logits,
                     mb_input_ids,
                     mb_response_masks,
                 )
                 logps[mini_batch_inds, : mb_last_valid_token_pos - 1] = batch_logps
 
-        ## 2) Reference.
-        if self.ref_model is not None:
-            all_ref_logps = []
-            with torch.no_grad():
-                for i in range(0, len(input_ids), args.train_batch_size_per_device):
-                    batch_inds = torch.arange(i, i + args.train_batch_size_per_device)
-
+                if self.ref_model is not None:
                     batch_ref_logits = self.ref_model(
-                        input_ids[batch_inds], attention_mask=att_mask[batch_inds]
-                    )["logits"].float()
-                    batch_ref_logits /= args.temperature
-                    batch_ref_logps = self.get_batch_logps(
+                        mb_input_ids, attention_mask=mb_att_mask
+                    )["logits"]
+                    batch_ref_logps = self.get_chunked_batch_logps(
                         batch_ref_logits,
-                        input_ids[batch_inds],
-                        response_masks[batch_inds],
+                        mb_input_ids,
+                        mb_response_masks,
+                    )
+                    ref_logps[mini_batch_inds, : mb_last_valid_token_pos - 1] = (
+                        batch_ref_logps
                     )
-                    all_ref_logps.append(batch_ref_logps)
-            ref_logps = torch.cat(all_ref_logps)
 
+        if self.ref_model is not None:
             # Combine final reward and kl penalty as rewards.
             kl_rewards = -args.kl_penalty_coef * (logps - ref_logps) * response_masks
             rewards = kl_rewards.clone()
-            del all_ref_logps
-            torch.cuda.empty_cache()
-            gc.collect()
         else:
             rewards = torch.zeros_like(response_masks).float()
 
@@ -613,15 +932,36 @@ class ZeroMathLearner(PPOLearner):
             ]
 
         # Compute losses and update models for multiple PPO epochs.
+        # Mini-batches are contiguous slices of the length-sorted rollouts (bucketing): each
+        # bucket's max length is close to its members' lengths, so the padding trimming below
+        # shrinks every forward pass. Buckets are visited in a random order every epoch.
+        buckets = torch.split(
+            torch.from_numpy(np.argsort(row_lens, kind="stable")),
+            args.train_batch_size_per_device,
+        )
         stats = defaultdict(list)
+        # Per-update scalars stay on device; they are reduced there after the loop.
+        num_updates = args.num_ppo_epochs * len(buckets)
+        stats_gpu = {
+            k: torch.zeros(num_updates, device=device)
+            for k in (
+                "logprobs_diff_max",
+                "logprobs_diff_min",
+                "zero_pg_loss_count",
+                "pg_clipfrac",
+            )
+        }
         local_grad_step = 0
         for _ in range(args.num_ppo_epochs):
-            batch_inds = np.random.permutation(len(input_ids))
-            for b_st in range(0, len(input_ids), args.train_batch_size_per_device):
+            if len(buckets) <= len(self._perm_buf):
+                bucket_order = torch.randperm(
+                    len(buckets), out=self._perm_buf[: len(buckets)]
+                )
+            else:
+                bucket_order = torch.randperm(len(buckets))
+            for b in bucket_order.tolist():
                 local_grad_step += 1
-                mini_batch_inds = batch_inds[
-                    b_st : b_st + args.train_batch_size_per_device
-                ]
+                mini_batch_inds = buckets[b]
                 mb_advantage = advantages[mini_batch_inds]
                 mb_input_ids = input_ids[mini_batch_inds]
                 mb_att_mask = att_mask[mini_batch_inds]
@@ -630,14 +970,9 @@ class ZeroMathLearner(PPOLearner):
                 mb_loss_masks = loss_masks[mini_batch_inds]
 
                 # Remove unnecessary padding introduced by the large PPO batch.
-                mb_valid_token_count_per_pos = mb_att_mask.sum(0)
-                mb_last_valid_token_pos = torch.where(
-                    mb_valid_token_count_per_pos == 0
-                )[0]
-                if len(mb_last_valid_token_pos) >= 1:
-                    mb_last_valid_token_pos = mb_last_valid_token_pos[0]
-                else:
-                    mb_last_valid_token_pos = mb_att_mask.shape[1]
+                mb_last_valid_token_pos = int(row_lens[mini_batch_inds.numpy()].max())
+                if args.loss_cuda_graphs:
+                    mb_last_valid_token_pos = input_ids.shape[1]
                 # # Further reduce valid token num to speed up IF:
                 # ## 1. We only have PG loss, i.e., args.beta == 0.
                 # ## 2. Advantage is zero in bandit case (e.g., GRPO).
@@ -670,182 +1005,59 @@ class ZeroMathLearner(PPOLearner):
                     mb_input_ids,
                     mb_response_masks,
                 )
+                # The boolean mask feeds the torch.where selects; the float copy, cast once here, is
+                # the multiplicative mask for the masked mean/sum reductions below.
+                mb_response_masks_float = mb_response_masks.float()
+                # Number of response tokens; constant w.r.t. the policy, so kept out of autograd.
+                # Clamped so that a fully-masked mini-batch cannot divide by zero.
+                mb_mask_count = mb_response_masks_float.sum().clamp_min(1.0)
                 if args.reinforce_update:
                     pg_loss_max = -mb_advantage * new_logps
-                elif self.args.critic_type_modify == "gmpo":
-                    cliprange = self.args.cliprange
-                    low_cliprange = torch.tensor(-cliprange).to(new_logps)
-                    high_cliprange = torch.tensor(cliprange).to(new_logps)
-
-                    sgn_advantage = -1 if mb_advantage >= 0 else 1
-                    logprobs_diff = new_logps - mb_logps
-                    sgn_logprobs_diff = sgn_advantage * logprobs_diff
-                    sgn_logprobs_diff_clamp = torch.clamp(sgn_logprobs_diff, low_cliprange, high_cliprange)
-                    sgn_logprobs_diff_max = torch.max(sgn_logprobs_diff, sgn_logprobs_diff_clamp)
-                    logprobs_diff_max = sgn_advantage * sgn_logprobs_diff_max
-
-                    ratio = torch.exp(logprobs_diff_max[mb_response_masks].sum() / mb_response_masks.sum())
-                    pg_losses = -mb_advantage * ratio
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_losses == 0).detach().sum().item()
-                    )
-
-                    pg_loss = pg_losses
-                    infos["pg_loss"] = pg_loss.detach()
-                    loss = pg_loss
-                elif self.args.critic_type_modify == "gmpo_noclip":
-                    cliprange = 1000
-                    low_cliprange = torch.tensor(-cliprange).to(new_logps)
-                    high_cliprange = torch.tensor(cliprange).to(new_logps)
-
-                    sgn_advantage = -1 if mb_advantage >= 0 else 1
-                    logprobs_diff = new_logps - mb_logps
-                    sgn_logprobs_diff = sgn_advantage * logprobs_diff
-                    sgn_logprobs_diff_clamp = torch.clamp(sgn_logprobs_diff, low_cliprange, high_cliprange)
-                    sgn_logprobs_diff_max = torch.max(sgn_logprobs_diff, sgn_logprobs_diff_clamp)
-                    logprobs_diff_max = sgn_advantage * sgn_logprobs_diff_max
-
-                    ratio = torch.exp(logprobs_diff_max[mb_response_masks].sum() / mb_response_masks.sum())
-                    pg_losses = -mb_advantage * ratio
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_losses == 0).detach().sum().item()
-                    )
-
-                    pg_loss = pg_losses
-                    infos["pg_loss"] = pg_loss.detach()
-                    loss = pg_loss
-                elif self.args.critic_type_modify == "gmpo_seqclip":
-                    cliprange = self.args.cliprange
-                    low_cliprange = torch.tensor(-cliprange).to(new_logps)
-                    high_cliprange = torch.tensor(cliprange).to(new_logps)
-
-                    sgn_advantage = -1 if mb_advantage >= 0 else 1
-                    logprobs_diff = (new_logps - mb_logps)[mb_response_masks].sum()
-                    sgn_logprobs_diff = sgn_advantage * logprobs_diff
-                    sgn_logprobs_diff_clamp = torch.clamp(sgn_logprobs_diff, low_cliprange, high_cliprange)
-                    sgn_logprobs_diff_max = torch.max(sgn_logprobs_diff, sgn_logprobs_diff_clamp)
-                    logprobs_diff_max = sgn_advantage * sgn_logprobs_diff_max
-
-                    ratio = torch.exp(logprobs_diff_max / mb_response_masks.sum())
-                    pg_losses = -mb_advantage * ratio
-
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_losses == 0).detach().sum().item()
-                    )
-
-                    pg_loss = pg_losses
-                    infos["pg_loss"] = pg_loss.detach()
-                    loss = pg_loss
-                elif self.args.critic_type_modify == "gmpo_without_norm":
-                    cliprange = self.args.cliprange
-                    low_cliprange = torch.tensor(-cliprange).to(new_logps)
-                    high_cliprange = torch.tensor(cliprange).to(new_logps)
-
-                    sgn_advantage = -1 if mb_advantage >= 0 else 1
-                    logprobs_diff = new_logps - mb_logps
-                    sgn_logprobs_diff = sgn_advantage * logprobs_diff
-                    sgn_logprobs_diff_clamp = torch.clamp(sgn_logprobs_diff, low_cliprange, high_cliprange)
-                    sgn_logprobs_diff_max = torch.max(sgn_logprobs_diff, sgn_logprobs_diff_clamp)
-                    logprobs_diff_max = sgn_advantage * sgn_logprobs_diff_max
-
-                    ratio = torch.exp(logprobs_diff_max[mb_response_masks].sum())
-                    pg_losses = -mb_advantage * ratio
-
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
+                else:
+                    pg_losses, logprobs_diff, pg_clipped = self._compiled_loss_fn(
+                        new_logps,
+                        mb_logps,
+                        mb_response_masks,
+                        mb_mask_count,
+                        mb_advantage,
                     )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_losses == 0).detach().sum().item()
+                    logprobs_diff_min, logprobs_diff_max = _masked_aminmax(
+                        logprobs_diff.detach(), mb_response_masks
                     )
-
-                    pg_loss = pg_losses
+                    stats_gpu["logprobs_diff_max"][local_grad_step - 1] = logprobs_diff_max
+                    stats_gpu["logprobs_diff_min"][local_grad_step - 1] = logprobs_diff_min
+                    stats_gpu["zero_pg_loss_count"][local_grad_step - 1] = torch.eq(
+                        pg_losses.detach(), 0
+                    ).sum(dtype=torch.int32)
+
+                    if self.args.critic_type_modify in GMPO_LOSS_TYPES:
+                        # Sequence-level loss already.
+                        pg_loss = pg_losses
+                    else:
+                        pg_loss = self.masked_aggregate_mean(
+                            pg_losses, mb_response_masks_float, mb_loss_masks
+                        )
                     infos["pg_loss"] = pg_loss.detach()
                     loss = pg_loss
-                elif self.args.critic_type_modify == "grpo_clip_wider":
-                    logprobs_diff = new_logps - mb_logps
-                    ratio = torch.exp(logprobs_diff)
-                    pg_losses = -mb_advantage * ratio
-                    pg_losses2 = -mb_advantage * torch.clamp(
-                        ratio, 0.67, 1.49
-                    )
-                    pg_loss_max = torch.max(pg_losses, pg_losses2)
 
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_loss_max == 0).detach().sum().item()
-                    )
-
-                    pg_loss = self.masked_aggregator(pg_loss_max, mb_response_masks, axis=1)
-                    pg_loss = (pg_loss * mb_loss_masks).mean()
-                    infos["pg_loss"] = pg_loss.detach()
-                    loss = pg_loss
-                else:
-                    logprobs_diff = new_logps - mb_logps
-                    ratio = torch.exp(logprobs_diff)
-                    pg_losses = -mb_advantage * ratio
-                    pg_losses2 = -mb_advantage * torch.clamp(
-                        ratio, 1.0 - args.cliprange, 1.0 + args.cliprange
+                if args.beta > 0:
+                    mb_ref_logps = self._gather_rows(
+                        self._ref_mb_buf,
+                        ref_logps[:, : mb_last_valid_token_pos - 1],
+                        mini_batch_inds.to(device, non_blocking=True),
                     )
-                    pg_loss_max = torch.max(pg_losses, pg_losses2)
+                    kl3_sum, kl3 = _kl3(mb_ref_logps, new_logps, mb_response_masks)
+                    infos["kl3"] = kl3_sum.detach()
 
-                    stats["logprobs_diff_max"].append(
-                        torch.amax(logprobs_diff.detach() * mb_response_masks).item()
-                    )
-                    stats["logprobs_diff_min"].append(
-                        torch.amin(logprobs_diff.detach() * mb_response_masks).item()
+                    reg_loss = args.beta * self.masked_aggregate_mean(
+                        kl3, mb_response_masks_float, mb_loss_masks
                     )
-                    stats["zero_pg_loss_count"].append(
-                        (pg_loss_max == 0).detach().sum().item()
-                    )
-
-                    pg_loss = self.masked_aggregator(pg_loss_max, mb_response_masks, axis=1)
-                    pg_loss = (pg_loss * mb_loss_masks).mean()
-                    infos["pg_loss"] = pg_loss.detach()
-                    loss = pg_loss
-
-                if args.beta > 0:
-                    mb_ref_logps = ref_logps[mini_batch_inds]
-                    mb_ref_logps = mb_ref_logps[:, : mb_last_valid_token_pos - 1]
-                    # k3 kl: http://joschu.net/blog/kl-approx.html.
-                    # clamp to avoid numerical instability.
-                    log_ratio = (mb_ref_logps - new_logps).clamp(-40.0, 40.0)
-                    kl3 = torch.expm1(log_ratio) - log_ratio  # expm1 is more stable.
-                    infos["kl3"] = (kl3 * mb_response_masks).detach().sum(1).mean()
-
-                    reg_loss = self.masked_aggregator(kl3, mb_response_masks, axis=1)
-                    reg_loss = args.beta * (reg_loss * mb_loss_masks).mean()
                     infos["reg_loss"] = reg_loss.detach()
                     loss += reg_loss
 
                 with torch.no_grad():
                     entropy = entropy_from_logits(logits[:, :-1])
-                    entropy = masked_mean(entropy, mb_response_masks)
+                    entropy = masked_mean(entropy, mb_response_masks_float)
                     infos["entropy"] = entropy
 
                 self.strategy.backward(loss, self.model, self.optimizer)
@@ -868,19 +1080,13 @@ class ZeroMathLearner(PPOLearner):
                         input_ids=mb_input_ids, attention_mask=mb_att_mask
                     )[:, :-1]
 
-                    value_pred_clipped = torch.clamp(
-                        value_pred,
-                        mb_values - args.cliprange_value,
-                        mb_values + args.cliprange_value,
+                    vf_loss_max, vf_clipped = _vf_loss(
+                        value_pred, mb_values, mb_return, args.cliprange_value
                     )
-                    vf_losses1 = torch.square(value_pred - mb_return)
-                    vf_losses2 = torch.square(value_pred_clipped - mb_return)
-                    vf_loss_max = torch.max(vf_losses1, vf_losses2)
 
-                    vf_loss = 0.5 * self.masked_aggregator(
-                        vf_loss_max, mb_response_masks, axis=1
+                    critic_loss = args.vf_coef * 0.5 * self.masked_aggregate_mean(
+                        vf_loss_max, mb_response_masks_float, mb_loss_masks
                     )
-                    critic_loss = args.vf_coef * (vf_loss * mb_loss_masks).mean()
 
                     self.strategy.backward(
                         critic_loss, self.critic, self.critic_optimizer
@@ -890,19 +1096,20 @@ class ZeroMathLearner(PPOLearner):
                     )
                     infos["critic_loss"] = critic_loss.detach()
                     infos["vf_clipfrac"] = masked_mean(
-                        (vf_losses2 > vf_losses1).float(), mb_response_masks
+                        vf_clipped.float(), mb_response_masks_float
                     ).detach()
 
                 with torch.no_grad():
-                    if not args.reinforce_update and "gmpo" in self.args.critic_type_modify:
-                        pg_clipfrac = (sgn_logprobs_diff != sgn_logprobs_diff_clamp).float()
-                        stats["pg_clipfrac"].append(pg_clipfrac.mean().min().item())
+                    if not args.reinforce_update and self.args.critic_type_modify in GMPO_LOSS_TYPES:
+                        pg_clipfrac = pg_clipped.float()
+                        stats_gpu["pg_clipfrac"][local_grad_step - 1] = pg_clipfrac.mean()
                     elif not args.reinforce_update:
                         pg_clipfrac = masked_mean(
-                            (pg_losses2 > pg_losses).float(), mb_response_masks, axis=1
+                            pg_clipped.float(), mb_response_masks_float, axis=1
                         )
-                        stats["pg_clipfrac"].append(pg_clipfrac.mean().min().item())
+                        stats_gpu["pg_clipfrac"][local_grad_step - 1] = pg_clipfrac.mean()
 
+        # Host-side stats (gradient norm and its timing) are Python lists.
         infos.update(
             {f"{k}_nan": torch.tensor(stats[k]).isnan().sum() for k in stats.keys()}
         )
@@ -912,21 +1119,32 @@ class ZeroMathLearner(PPOLearner):
         infos["policy_grad_norm"] = torch.tensor(stats["policy_grad_norm"]).max()
         infos["get_grad_norm_time"] = torch.tensor(sum(stats["get_grad_norm_time"]))
         if not args.reinforce_update:
-            infos["logprobs_diff_max"] = torch.tensor(stats["logprobs_diff_max"]).max()
-            infos["logprobs_diff_min"] = torch.tensor(stats["logprobs_diff_min"]).min()
-            infos["zero_pg_loss_count"] = (
-                torch.tensor(stats["zero_pg_loss_count"]).float().mean()
-            )
-            infos["pg_clipfrac"] = torch.tensor(stats["pg_clipfrac"]).mean()
-        infos["adv_mean"] = advantages.mean().cpu()
-        infos["adv_min"] = advantages.min().cpu()
-        infos["adv_max"] = advantages.max().cpu()
-        infos["all_zero_rewards_count"] = (
-            (final_rewards.view(-1, self.args.num_samples).mean(-1) == 0).sum().cpu()
-        )
-        infos["all_one_rewards_count"] = (
-            (final_rewards.view(-1, self.args.num_samples).mean(-1) == 1).sum().cpu()
-        )
+            # Per-update stats are reduced on device, one kernel per key.
+            for k, v in stats_gpu.items():
+                infos[f"{k}_nan"] = torch.isnan(v).sum()
+                infos[f"{k}_inf"] = torch.isinf(v).sum()
+            infos["logprobs_diff_max"] = stats_gpu["logprobs_diff_max"].max()
+            infos["logprobs_diff_min"] = stats_gpu["logprobs_diff_min"].min()
+            infos["zero_pg_loss_count"] = stats_gpu["zero_pg_loss_count"].mean()
+            infos["pg_clipfrac"] = stats_gpu["pg_clipfrac"].mean()
+        # Advantage / reward summaries are stacked so that they reach the host in one copy.
+        adv_min, adv_max = torch.aminmax(advantages)
+        group_rewards = final_rewards.view(-1, self.args.num_samples).mean(-1)
+        (
+            infos["adv_mean"],
+            infos["adv_min"],
+            infos["adv_max"],
+            infos["all_zero_rewards_count"],
+            infos["all_one_rewards_count"],
+        ) = torch.stack(
+            [
+                advantages.mean(),
+                adv_min,
+                adv_max,
+                (group_rewards == 0).sum(dtype=torch.float32),
+                (group_rewards == 1).sum(dtype=torch.float32),
+            ]
+        ).cpu().unbind()
 
         return infos
 
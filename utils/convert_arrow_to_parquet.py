@@ -1,5 +1,6 @@
+import os
+
 from datasets import load_from_disk
-import pandas as pd
 
 def convert_single_dataset(input_path, output_path, data_source_name):
     """Convert a single Arrow dataset to target parquet format."""
@@ -11,22 +12,27 @@ def convert_single_dataset(input_path, output_path, data_source_name):
     if hasattr(dataset, 'items'):
         dataset = dataset['train'] if 'train' in dataset else list(dataset.values())[0]
     
-    # Convert format
-    converted_data = []
-    for idx, example in enumerate(dataset):
-        record = {
-            "data_source": "",
-            "prompt": [{"content": example["problem"], "role": "user"}],
-            "ability": "math",
-            "reward_model": {"ground_truth": example["answer"], "style": "rule"},
-            "extra_info": {"index": idx, "split": data_source_name}
+    # Convert format (batched, so rows are built as Arrow columns rather than Python dicts)
+    def transform(batch, indices):
+        return {
+            "data_source": [""] * len(indices),
+            "prompt": [[{"content": p, "role": "user"}] for p in batch["problem"]],
+            "ability": ["math"] * len(indices),
+            "reward_model": [{"ground_truth": a, "style": "rule"} for a in batch["answer"]],
+            "extra_info": [{"index": i, "split": data_source_name} for i in indices],
         }
-        converted_data.append(record)
+
+    dataset = dataset.map(
+        transform,
+        batched=True,
+        with_indices=True,
+        remove_columns=dataset.column_names,
+        num_proc=min(os.cpu_count(), max(1, len(dataset) // 1000)),
+    )
     
     # Save as parquet
-    df = pd.DataFrame(converted_data)
-    df.to_parquet(output_path, index=False)
-    print(f"Converted {len(converted_data)} examples to {output_path}")
+    dataset.to_parquet(output_path)
+    print(f"Converted {len(dataset)} examples to {output_path}")
 
 # Example usage:
 if __name__ == "__main__":
@@ -886,6 +886,9 @@ def split_tuple(expr: str):
     return elems
 
 
+_BRACE_RE = re.compile(r"[{}]")
+
+
 def last_boxed_only_string(string):
     idx = string.rfind("\\boxed")
     if idx < 0:
@@ -893,18 +896,18 @@ def last_boxed_only_string(string):
         if idx < 0:
             return None
 
-    i = idx
+    # Only braces affect the matching, so let the regex engine skip all other characters.
     right_brace_idx = None
     num_left_braces_open = 0
-    while i < len(string):
+    for match in _BRACE_RE.finditer(string, idx):
+        i = match.start()
         if string[i] == "{":
             num_left_braces_open += 1
-        if string[i] == "}":
+        else:
             num_left_braces_open -= 1
             if num_left_braces_open == 0:
                 right_brace_idx = i
                 break
-        i += 1
 
     if right_brace_idx == None:
         retval = None
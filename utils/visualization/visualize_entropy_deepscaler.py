@@ -4,6 +4,7 @@ import random
 from collections import OrderedDict
 from scipy.signal import savgol_filter
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import os
 
@@ -16,16 +17,16 @@ plt.figure(figsize=(10, 6))
 col_idxes = [1, 4]
 
 max_len = 800
-for col_idx in col_idxes:
+entropies = df.iloc[:max_len, col_idxes].to_numpy(dtype=np.float32)
+steps = np.arange(entropies.shape[0])
+for i, col_idx in enumerate(col_idxes):
     if col_idx == 1:
         name = "GMPO"
         color = (0, 0.8, 0.2)
     elif col_idx == 4:
         name = "GRPO"
         color = (1, 0, 0)
-    entropy = df[df.columns[col_idx]].tolist()
-    entropy = entropy[:800]
-    steps = list(range(len(entropy)))
+    entropy = entropies[:, i]
 
     # 绘制平滑后的 logprobs_diff_max 曲线
     plt.plot(steps, entropy, label=f"{name}", color=color, linewidth=3)
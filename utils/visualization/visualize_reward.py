@@ -1,9 +1,10 @@
-import json
+import orjson
 import tqdm
 import random
 from collections import OrderedDict
 from scipy.signal import savgol_filter
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import os
 
@@ -14,19 +15,29 @@ log_files = [os.path.join(log_dir, f) for f in os.listdir(log_dir) if f.endswith
 # 创建一个空的DataFrame
 data = OrderedDict()
 
+def iter_log_records(log_file):
+    """Yields the records of a log written by repeated `json.dump(..., indent=2)`, one at a time.
+
+    Only a record's closing brace starts a line, and the next record opens right after it (`}{`).
+    """
+    record = []
+    with open(log_file, 'rb') as f:
+        for line in f:
+            if line.startswith(b'}'):
+                record.append(b'}')
+                yield orjson.loads(b''.join(record))
+                record = [line[1:]]
+            else:
+                record.append(line)
+    if b''.join(record).strip():
+        yield orjson.loads(b''.join(record))
+
 # 解析每个log文件
 for log_file in tqdm.tqdm(log_files):
-    with open(log_file, 'r') as f:
-        log_content = f.read()
-        log_content = log_content.replace('}{', '},{')
-        log_content = log_content.replace('\n', '') 
-        log_content = f'[{log_content}]'
-        
-        try:
-            log_data = json.loads(log_content)
-            data[log_file] = log_data[1:]
-        except json.JSONDecodeError:
-            print(f"Error parsing file {log_file}")
+    try:
+        data[log_file] = list(iter_log_records(log_file))[1:]
+    except orjson.JSONDecodeError:
+        print(f"Error parsing file {log_file}")
 
 def random_color():
     return (random.random(), random.random(), random.random())
@@ -63,11 +74,12 @@ for name, value in data.items():
         color = (1, 0, 0)
     else:
         continue
-    reward = [el["actor/rewards"] if el["actor/rewards"]<300 else 300 for el in value[:max_len] if "actor/rewards" in el]
+    reward = np.fromiter((el["actor/rewards"] for el in value[:max_len] if "actor/rewards" in el), dtype=np.float32)
+    np.minimum(reward, 300.0, out=reward)
     # response_length = [el["eval/average/response_tok_len"] for el in value[:max_len] if "eval/average/accuracy" in el]
     # steps = [el["train/learning_round"] for el in value[:max_len] if "eval/average/accuracy" in el]
 
-    steps = list(range(len(reward)))
+    steps = np.arange(len(reward))
     reward = savgol_filter(reward, window_length=11, polyorder=3)
     # 绘制平滑后的 logprobs_diff_max 曲线
     plt.plot(steps, reward, label=f"{name}", color=color, linewidth=3)